@@ -1,107 +1,404 @@
 import asyncio
 import aiohttp
-import json
+from bisect import bisect_right
+from cachetools import TTLCache
+import gzip
+from itertools import islice
+import orjson
+import os
 import random
-from typing import Final, Dict, Any, List, Set
+import re
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from typing import Final, Dict, Any, Awaitable, Callable, List, Optional, Set, Tuple
 import logging
-from datetime import datetime, timedelta
-from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import queue
+from datetime import date, datetime, timedelta, timezone
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import Forbidden, RetryAfter, TelegramError
+from telegram.request import HTTPXRequest
+from telegram.ext import Application, ApplicationBuilder, MessageHandler, ContextTypes, filters
 
 # Configure logging
+_LOG_FORMAT: Final = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+_LOG_FILE: Final = 'bot.log'
+_LOG_MAX_BYTES: Final = 10 * 1024 * 1024
+_LOG_BACKUPS: Final = 5
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format=_LOG_FORMAT,
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
+# httpx logs every request URL at INFO, and Bot API URLs contain the token
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+def _start_log_listener() -> QueueListener:
+    """Route all logging through a queue so handler I/O happens on a listener thread
+
+    QueueHandler.prepare() still formats each record on the calling thread.
+    """
+    formatter = logging.Formatter(_LOG_FORMAT)
+    handlers = [
+        logging.StreamHandler(),
+        RotatingFileHandler(_LOG_FILE, maxBytes=_LOG_MAX_BYTES, backupCount=_LOG_BACKUPS, encoding='utf-8'),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    logging.root.handlers = [QueueHandler(log_queue)]
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
 
 # Constants - REPLACE THESE FOR PRODUCTION
 TOKEN: Final = ''  # Replace with your actual bot token
 BOT_USERNAME: Final = '@Leetcoder77bot'
 GEMINI_API_KEY: Final = ''  # Replace with your actual Gemini API key
-GEMINI_API_URL: Final = ={GEMINI_API_KEY}'
+ADMIN_USER_IDS: Final[Set[int]] = set()  # Telegram user IDs allowed to run admin commands
+GEMINI_API_URL: Final = f'https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent?key={GEMINI_API_KEY}'
+
+# Update delivery - 'polling', or 'webhook' behind an HTTPS reverse proxy (nginx/Caddy)
+MODE: Final = 'polling'
+WEBHOOK_URL: Final = ''  # Public HTTPS base URL, e.g. 'https://bot.example.com'
+WEBHOOK_LISTEN: Final = '127.0.0.1'  # Only the local reverse proxy should reach the listener
+WEBHOOK_PORT: Final = 8443
+WEBHOOK_PATH: Final = 'webhook'
+WEBHOOK_SECRET: Final = ''  # Required in webhook mode; Telegram echoes it in X-Telegram-Bot-Api-Secret-Token
+
+# Configuration sanity checks, evaluated once at import
+_TOKEN_RE: Final = re.compile(r'^\d{6,}:[A-Za-z0-9_-]{30,}$')
+_GEMINI_KEY_RE: Final = re.compile(r'^[A-Za-z0-9_-]{30,}$')
+
+def _config_errors() -> List[str]:
+    errors = []
+    if not _TOKEN_RE.match(TOKEN):
+        errors.append("❌ Please set your bot token! TOKEN is empty or not in '<digits>:<secret>' form.")
+    if not _GEMINI_KEY_RE.match(GEMINI_API_KEY):
+        errors.append("❌ Please set your Gemini API key! GEMINI_API_KEY is empty or malformed.")
+    if MODE not in ('polling', 'webhook'):
+        errors.append(f"❌ Unknown MODE {MODE!r}; use 'polling' or 'webhook'.")
+    elif MODE == 'webhook' and not WEBHOOK_URL:
+        errors.append("❌ MODE is 'webhook' but WEBHOOK_URL is empty. Set it to the bot's public HTTPS URL.")
+    if MODE == 'webhook' and not WEBHOOK_SECRET:
+        errors.append("❌ MODE is 'webhook' but WEBHOOK_SECRET is empty. Without it anyone can post forged updates.")
+    return errors
+
+CONFIG_ERRORS: Final = _config_errors()
+
+# Only plain messages are handled (inline buttons are URL links, not callbacks)
+ALLOWED_UPDATES: Final = [Update.MESSAGE]
+# New, non-command text messages; built once and reused by the fallback handler
+TEXT_ONLY: Final = filters.TEXT & ~filters.COMMAND & filters.UpdateType.MESSAGE
 
 # Define constant instead of duplicating "application/json" literal
 CONTENT_TYPE_JSON: Final = "application/json"
 
-# User data storage
+# Default headers for the shared session; "br" needs the brotli package installed
+_DEFAULT_HEADERS: Final = {
+    "Accept-Encoding": "gzip, deflate, br",
+    "Content-Type": CONTENT_TYPE_JSON,
+    "User-Agent": "LeetcoderBot/1.0"
+}
+
+# Request timeouts: the session default covers the large problem-list and Gemini calls
+_TIMEOUT_LONG: Final = aiohttp.ClientTimeout(total=30)
+_TIMEOUT_SHORT: Final = aiohttp.ClientTimeout(total=15)
+
+# Markdown markers stripped when a formatted message is rejected
+_MD_STRIP_TABLE: Final = str.maketrans('', '', '*_`')
+
+# Telegram rejects messages longer than this
+_MAX_MESSAGE_LENGTH: Final = 4096
+
+# Parallel sends per broadcast, and the send rate kept under Telegram's ~30 msg/s global limit
+_BROADCAST_CONCURRENCY: Final = 25
+_BROADCAST_RATE: Final = 25  # messages per second
+
+# On-disk copy of the full problem list, reused across restarts
+_CACHE_PATH: Final = "problems.json.gz"
+_CACHE_TTL: Final = 86400  # seconds
+
+# SQLite file holding user state across restarts
+_DB_PATH: Final = "bot.db"
+_DAILY_RETENTION_DAYS: Final = 7
+
+# In-memory mirror of the persisted chat IDs, loaded in post_init
 user_chat_ids: Set[int] = set()
-user_daily_problems: Dict[int, Dict[str, Any]] = {}
-user_profiles: Dict[int, Dict[str, Any]] = {}
+
+# Long-running tasks started in post_init and cancelled on shutdown
+_background_tasks: Set[asyncio.Task] = set()
+
+# Handler errors are queued by error_handler and logged in batches by _drain_errors
+_error_queue: Optional[asyncio.Queue] = None
+_ERROR_QUEUE_SIZE: Final = 1024
+_ERROR_BATCH_SIZE: Final = 32
+_ERROR_BATCH_WAIT: Final = 0.5  # seconds
+
+# Shared HTTP session, reused by every outbound LeetCode / Gemini request
+_http_session: Optional[aiohttp.ClientSession] = None
+
+def _get_session() -> aiohttp.ClientSession:
+    """Return the shared HTTP session, creating it lazily on first use"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            timeout=_TIMEOUT_LONG,
+            connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=75),
+            headers=_DEFAULT_HEADERS
+        )
+    return _http_session
+
+async def _close_session() -> None:
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+# GraphQL queries, built once at import
+_QUERY_ALL_PROBLEMS: Final = """
+query problemsetQuestionList($categorySlug: String, $limit: Int, $skip: Int, $filters: QuestionListFilterInput) {
+    problemsetQuestionList: questionList(
+        categorySlug: $categorySlug
+        limit: $limit
+        skip: $skip
+        filters: $filters
+    ) {
+        total: totalNum
+        questions: data {
+            acRate
+            difficulty
+            freqBar
+            frontendQuestionId: questionFrontendId
+            isFavor
+            paidOnly: isPaidOnly
+            status
+            title
+            titleSlug
+            topicTags {
+                name
+                id
+                slug
+            }
+        }
+    }
+}
+"""
+
+_QUERY_USER_PROFILE: Final = """
+query getUserProfile($username: String!) {
+    matchedUser(username: $username) {
+        username
+        profile {
+            ranking
+            userAvatar
+            realName
+            aboutMe
+            school
+            websites
+            countryName
+            company
+            jobTitle
+            skillTags
+            postViewCount
+            postViewCountDiff
+            reputation
+            reputationDiff
+        }
+        submitStats {
+            acSubmissionNum {
+                difficulty
+                count
+                submissions
+            }
+            totalSubmissionNum {
+                difficulty
+                count
+                submissions
+            }
+        }
+        badges {
+            id
+            displayName
+            icon
+            creationDate
+        }
+    }
+}
+"""
+
+_QUERY_DAILY: Final = """
+query questionOfToday {
+    activeDailyCodingChallengeQuestion {
+        date
+        userStatus
+        link
+        question {
+            acRate
+            difficulty
+            freqBar
+            frontendQuestionId: questionFrontendId
+            isFavor
+            paidOnly: isPaidOnly
+            status
+            title
+            titleSlug
+            hasVideoSolution
+            hasSolution
+            topicTags {
+                name
+                id
+                slug
+            }
+        }
+    }
+}
+"""
+
+# Request bodies with no per-call variables are serialized once
+_BODY_ALL_PROBLEMS: Final = orjson.dumps({
+    "query": _QUERY_ALL_PROBLEMS,
+    "variables": {"categorySlug": "", "skip": 0, "limit": 2000, "filters": {}}
+})
+_BODY_DAILY: Final = orjson.dumps({"query": _QUERY_DAILY})
+
+def _load_problems_from_disk() -> List[Dict[str, Any]]:
+    """Read the cached problem list, or return [] if it is missing or stale"""
+    try:
+        if time.time() - os.stat(_CACHE_PATH).st_mtime >= _CACHE_TTL:
+            return []
+        with gzip.open(_CACHE_PATH, 'rb') as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable problem cache: {e}")
+        return []
+
+def _save_problems_to_disk(problems: List[Dict[str, Any]]) -> None:
+    tmp_path = f"{_CACHE_PATH}.tmp"
+    try:
+        with gzip.open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(problems))
+        os.replace(tmp_path, _CACHE_PATH)
+    except OSError as e:
+        logger.warning(f"Could not write problem cache: {e}")
 
 class LeetCodeService:
     def __init__(self):
         self.base_url = "https://leetcode.com/graphql"
         self.problems_cache = []
         self.cache_loaded = False
+        # One future per in-flight request, shared by concurrent identical callers
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        # Free problems partitioned by difficulty, rebuilt whenever the cache changes.
+        # The None key holds every free problem.
+        self.by_difficulty_free: Dict[Optional[str], List[Dict[str, Any]]] = {None: []}
+        self.speed_buckets: Dict[str, List[Dict[str, Any]]] = {}
+        self.knowledge_buckets: Dict[str, List[Dict[str, Any]]] = {}
+        # Short-lived response caches: profiles by username, daily challenge by UTC date
+        self.profile_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+        self.daily_cache: TTLCache = TTLCache(maxsize=1, ttl=3600)
+
+    def _set_cache(self, problems: List[Dict[str, Any]]) -> None:
+        """Store the problem list and pre-partition the free problems into buckets"""
+        free_problems = [p for p in problems if not p.get('paidOnly', True)]
+        by_difficulty = {None: free_problems}
+        speed_buckets = {}
+        knowledge_buckets = {}
+        for p in free_problems:
+            difficulty = p.get('difficulty', '').upper()
+            ac_rate = p.get('acRate', 0)
+            by_difficulty.setdefault(difficulty, []).append(p)
+            if ac_rate > 40:
+                speed_buckets.setdefault(difficulty, []).append(p)
+            if ac_rate < 60:
+                knowledge_buckets.setdefault(difficulty, []).append(p)
+
+        self.problems_cache = problems
+        self.cache_loaded = True
+        self.by_difficulty_free = by_difficulty
+        self.speed_buckets = speed_buckets
+        self.knowledge_buckets = knowledge_buckets
+
+    @staticmethod
+    def _choose(buckets: Dict[str, List[Dict[str, Any]]], difficulties: tuple) -> Optional[Dict[str, Any]]:
+        """Pick uniformly across several buckets without concatenating them"""
+        index = random.randrange(sum(len(buckets.get(d, ())) for d in difficulties) or 1)
+        for d in difficulties:
+            bucket = buckets.get(d, ())
+            if index < len(bucket):
+                return bucket[index]
+            index -= len(bucket)
+        return None
 
-    async def get_all_problems(self) -> List[Dict[str, Any]]:
-        if self.cache_loaded and self.problems_cache:
+    async def _coalesce(self, key: Tuple[str, str], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fetch() at most once per key at a time; concurrent callers share its result"""
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fetch()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_all_problems(self, force_refresh: bool = False) -> List[Dict[str, Any]]:
+        if self.cache_loaded and self.problems_cache and not force_refresh:
             return self.problems_cache
+        # A forced refresh must not join a normal load, which may return the disk copy
+        key = ("problems", "force" if force_refresh else "")
+        return await self._coalesce(key, lambda: self._load_problems(force_refresh))
 
-        query = """
-        query problemsetQuestionList($categorySlug: String, $limit: Int, $skip: Int, $filters: QuestionListFilterInput) {
-            problemsetQuestionList: questionList(
-                categorySlug: $categorySlug
-                limit: $limit
-                skip: $skip
-                filters: $filters
-            ) {
-                total: totalNum
-                questions: data {
-                    acRate
-                    difficulty
-                    freqBar
-                    frontendQuestionId: questionFrontendId
-                    isFavor
-                    paidOnly: isPaidOnly
-                    status
-                    title
-                    titleSlug
-                    topicTags {
-                        name
-                        id
-                        slug
-                    }
-                }
-            }
-        }
-        """
-        variables = {
-            "categorySlug": "",
-            "skip": 0,
-            "limit": 2000,
-            "filters": {}
-        }
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(
-                    self.base_url,
-                    json={"query": query, "variables": variables},
-                    headers={"Content-Type": CONTENT_TYPE_JSON},
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        problems = data.get('data', {}).get('problemsetQuestionList', {}).get('questions', [])
-                        self.problems_cache = problems
-                        self.cache_loaded = True
-                        logger.info(f"Cached {len(problems)} problems")
-                        return problems
-                    else:
-                        logger.error(f"LeetCode API returned status {response.status}")
-                        return []
-            except Exception as e:
-                logger.error(f"Error fetching all problems: {e}")
-                return []
+    async def _load_problems(self, force_refresh: bool) -> List[Dict[str, Any]]:
+        if not force_refresh:
+            problems = await asyncio.to_thread(_load_problems_from_disk)
+            if problems:
+                self._set_cache(problems)
+                logger.info(f"Loaded {len(problems)} problems from {_CACHE_PATH}")
+                return problems
+
+        try:
+            async with _get_session().post(
+                self.base_url,
+                data=_BODY_ALL_PROBLEMS
+            ) as response:
+                if response.status == 200:
+                    data = orjson.loads(await response.read())
+                    problems = data.get('data', {}).get('problemsetQuestionList', {}).get('questions', [])
+                    if problems:
+                        self._set_cache(problems)
+                        await asyncio.to_thread(_save_problems_to_disk, problems)
+                    encoding = response.headers.get('Content-Encoding', 'identity')
+                    logger.info(f"Cached {len(problems)} problems (Content-Encoding: {encoding})")
+                    return problems
+                else:
+                    logger.error(f"LeetCode API returned status {response.status}")
+                    return []
+        except Exception as e:
+            logger.error(f"Error fetching all problems: {e}")
+            return []
 
     async def get_personalized_problems(self, user_data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
         """Get 2 personalized problems: one for speed, one for knowledge"""
-        problems = await self.get_all_problems()
-        if not problems:
-            return {}
-
-        free_problems = [p for p in problems if not p.get('paidOnly', True)]
+        await self.get_all_problems()
+        free_problems = self.by_difficulty_free[None]
         if not free_problems:
             return {}
 
@@ -109,32 +406,23 @@ class LeetCodeService:
         
         # Determine user level and appropriate difficulties
         if total_solved < 50:
-            speed_difficulties = ['Easy']
-            knowledge_difficulties = ['Easy', 'Medium']
+            speed_difficulties = ('EASY',)
+            knowledge_difficulties = ('EASY', 'MEDIUM')
         elif total_solved < 150:
-            speed_difficulties = ['Easy', 'Medium']
-            knowledge_difficulties = ['Medium']
+            speed_difficulties = ('EASY', 'MEDIUM')
+            knowledge_difficulties = ('MEDIUM',)
         elif total_solved < 300:
-            speed_difficulties = ['Medium']
-            knowledge_difficulties = ['Medium', 'Hard']
+            speed_difficulties = ('MEDIUM',)
+            knowledge_difficulties = ('MEDIUM', 'HARD')
         else:
-            speed_difficulties = ['Medium', 'Hard']
-            knowledge_difficulties = ['Hard']
+            speed_difficulties = ('MEDIUM', 'HARD')
+            knowledge_difficulties = ('HARD',)
 
         # Speed problem: easier, high acceptance rate
-        speed_candidates = [
-            p for p in free_problems 
-            if p.get('difficulty') in speed_difficulties and p.get('acRate', 0) > 40
-        ]
-        
-        # Knowledge problem: challenging, lower acceptance rate
-        knowledge_candidates = [
-            p for p in free_problems 
-            if p.get('difficulty') in knowledge_difficulties and p.get('acRate', 0) < 60
-        ]
+        speed_problem = self._choose(self.speed_buckets, speed_difficulties) or random.choice(free_problems)
 
-        speed_problem = random.choice(speed_candidates) if speed_candidates else random.choice(free_problems)
-        knowledge_problem = random.choice(knowledge_candidates) if knowledge_candidates else random.choice(free_problems)
+        # Knowledge problem: challenging, lower acceptance rate
+        knowledge_problem = self._choose(self.knowledge_buckets, knowledge_difficulties) or random.choice(free_problems)
 
         return {
             'speed_problem': speed_problem,
@@ -142,118 +430,65 @@ class LeetCodeService:
         }
 
     async def get_user_profile(self, username: str) -> Dict[str, Any]:
-        query = """
-        query getUserProfile($username: String!) {
-            matchedUser(username: $username) {
-                username
-                profile {
-                    ranking
-                    userAvatar
-                    realName
-                    aboutMe
-                    school
-                    websites
-                    countryName
-                    company
-                    jobTitle
-                    skillTags
-                    postViewCount
-                    postViewCountDiff
-                    reputation
-                    reputationDiff
-                }
-                submitStats {
-                    acSubmissionNum {
-                        difficulty
-                        count
-                        submissions
-                    }
-                    totalSubmissionNum {
-                        difficulty
-                        count
-                        submissions
-                    }
-                }
-                badges {
-                    id
-                    displayName
-                    icon
-                    creationDate
-                }
-            }
-        }
-        """
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(
-                    self.base_url,
-                    json={"query": query, "variables": {"username": username}},
-                    headers={"Content-Type": CONTENT_TYPE_JSON},
-                    timeout=aiohttp.ClientTimeout(total=15)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data.get('data', {}).get('matchedUser', {})
-                    return {}
-            except Exception as e:
-                logger.error(f"Error fetching user profile: {e}")
+        profile = self.profile_cache.get(username)
+        if profile is None:
+            profile = await self._coalesce(("profile", username), lambda: self._fetch_user_profile(username))
+            if profile:
+                self.profile_cache[username] = profile
+        return profile
+
+    async def _fetch_user_profile(self, username: str) -> Dict[str, Any]:
+        try:
+            async with _get_session().post(
+                self.base_url,
+                data=orjson.dumps({"query": _QUERY_USER_PROFILE, "variables": {"username": username}}),
+                timeout=_TIMEOUT_SHORT
+            ) as response:
+                if response.status == 200:
+                    data = orjson.loads(await response.read())
+                    return data.get('data', {}).get('matchedUser', {})
                 return {}
+        except Exception as e:
+            logger.error(f"Error fetching user profile: {e}")
+            return {}
 
     async def get_random_problem(self, difficulty: str = None) -> Dict[str, Any]:
-        problems = await self.get_all_problems()
-        if not problems:
-            return {}
-        if difficulty:
-            filtered_problems = [p for p in problems if p.get('difficulty', '').upper() == difficulty.upper()]
-            problems = filtered_problems if filtered_problems else problems
-        free_problems = [p for p in problems if not p.get('paidOnly', True)]
+        await self.get_all_problems()
+        free_problems = self.by_difficulty_free.get(difficulty.upper() if difficulty else None)
+        if not free_problems:
+            free_problems = self.by_difficulty_free[None]
         if not free_problems:
             return {}
         return random.choice(free_problems)
 
     async def get_daily_challenge(self) -> Dict[str, Any]:
-        query = """
-        query questionOfToday {
-            activeDailyCodingChallengeQuestion {
-                date
-                userStatus
-                link
-                question {
-                    acRate
-                    difficulty
-                    freqBar
-                    frontendQuestionId: questionFrontendId
-                    isFavor
-                    paidOnly: isPaidOnly
-                    status
-                    title
-                    titleSlug
-                    hasVideoSolution
-                    hasSolution
-                    topicTags {
-                        name
-                        id
-                        slug
-                    }
-                }
-            }
-        }
-        """
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(
-                    self.base_url,
-                    json={"query": query},
-                    headers={"Content-Type": CONTENT_TYPE_JSON},
-                    timeout=aiohttp.ClientTimeout(total=15)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data.get('data', {}).get('activeDailyCodingChallengeQuestion', {})
-                    return {}
-            except Exception as e:
-                logger.error(f"Error fetching daily challenge: {e}")
+        # LeetCode rolls the daily challenge over at midnight UTC
+        today_utc = datetime.now(timezone.utc).date().isoformat()
+        daily = self.daily_cache.get(today_utc)
+        if daily is None:
+            daily = await self._coalesce(("daily", today_utc), self._fetch_daily_challenge)
+            if daily:
+                self.daily_cache[today_utc] = daily
+        return daily
+
+    async def _fetch_daily_challenge(self) -> Dict[str, Any]:
+        try:
+            async with _get_session().post(
+                self.base_url,
+                data=_BODY_DAILY,
+                timeout=_TIMEOUT_SHORT
+            ) as response:
+                if response.status == 200:
+                    data = orjson.loads(await response.read())
+                    return data.get('data', {}).get('activeDailyCodingChallengeQuestion', {})
                 return {}
+        except Exception as e:
+            logger.error(f"Error fetching daily challenge: {e}")
+            return {}
+
+def _extract_gemini_text(body: bytes) -> str:
+    """Parse a generateContent response and return the first candidate's text"""
+    return orjson.loads(body)['candidates'][0]['content']['parts'][0]['text']
 
 class GeminiService:
     @staticmethod
@@ -274,51 +509,221 @@ class GeminiService:
                 "parts": [{"text": prompt}]
             }]
         }
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(
-                    GEMINI_API_URL,
-                    json=payload,
-                    headers={"Content-Type": CONTENT_TYPE_JSON},
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data['candidates'][0]['content']['parts'][0]['text']
-                    else:
-                        return "AI service temporarily unavailable. Please try again later."
-            except Exception as e:
-                logger.error(f"Error with Gemini API: {e}")
-                return "AI service temporarily unavailable. Please try again later."
+        try:
+            async with _get_session().post(GEMINI_API_URL, data=orjson.dumps(payload)) as response:
+                if response.status == 200:
+                    body = await response.read()
+                    return await asyncio.to_thread(_extract_gemini_text, body)
+                else:
+                    return "AI service temporarily unavailable. Please try again later."
+        except Exception as e:
+            logger.error(f"Error with Gemini API: {e}")
+            return "AI service temporarily unavailable. Please try again later."
+
+class OrjsonRequest(HTTPXRequest):
+    """HTTPXRequest that decodes Bot API responses with orjson"""
+
+    @staticmethod
+    def parse_json_payload(payload: bytes) -> Dict[str, Any]:
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            # PTB's decoder tolerates invalid UTF-8 and raises the proper TelegramError
+            return HTTPXRequest.parse_json_payload(payload)
+
+class UserStore:
+    """SQLite-backed user state: known chats and daily problems"""
+
+    # Solved flags live in their own columns so /solved is a single-row UPDATE
+    _SOLVED_COLUMNS: Final = ('solved_speed', 'solved_knowledge')
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        # sqlite3 connections are shared across to_thread workers, so serialize access
+        self._lock = threading.Lock()
+        # Cache-aside for daily records; set_daily and mark_solved both write the DB and
+        # update this cache, and any new write path must do the same or it goes stale
+        self._daily_cache: TTLCache = TTLCache(maxsize=10_000, ttl=3600)
+
+    def _connect(self) -> None:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chats (chat_id INTEGER PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS daily (
+                uid INTEGER PRIMARY KEY, date TEXT NOT NULL, data BLOB NOT NULL,
+                solved_speed INTEGER NOT NULL DEFAULT 0, solved_knowledge INTEGER NOT NULL DEFAULT 0
+            );
+            DROP TABLE IF EXISTS profiles;
+        """)
+        # Databases created before the solved columns existed
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(daily)")}
+        for column in self._SOLVED_COLUMNS:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE daily ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        conn.commit()
+        self._conn = conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            if self._conn.in_transaction:
+                self._conn.commit()
+            return rows
+
+    async def _run(self, sql: str, params: tuple = ()) -> List[tuple]:
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def open(self) -> None:
+        await asyncio.to_thread(self._connect)
+        await self.purge_daily()
+
+    async def purge_daily(self) -> None:
+        """Delete daily records older than _DAILY_RETENTION_DAYS"""
+        cutoff = (date.today() - timedelta(days=_DAILY_RETENTION_DAYS)).isoformat()
+        await self._run("DELETE FROM daily WHERE date < ?", (cutoff,))
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await asyncio.to_thread(conn.close)
+
+    async def load_chat_ids(self) -> Set[int]:
+        return {row[0] for row in await self._run("SELECT chat_id FROM chats")}
+
+    async def add_chat(self, chat_id: int) -> None:
+        await self._run("INSERT OR IGNORE INTO chats VALUES (?)", (chat_id,))
+
+    async def remove_chat(self, chat_id: int) -> None:
+        await self._run("DELETE FROM chats WHERE chat_id = ?", (chat_id,))
+
+    async def get_daily(self, uid: int) -> Optional[Dict[str, Any]]:
+        """Return the user's most recent daily problems record, if any"""
+        record = self._daily_cache.get(uid)
+        if record is None:
+            rows = await self._run(
+                "SELECT data, solved_speed, solved_knowledge FROM daily WHERE uid = ?", (uid,)
+            )
+            if not rows:
+                return None
+            data, solved_speed, solved_knowledge = rows[0]
+            record = orjson.loads(data)
+            # Rows written before the columns existed keep their flags in the blob
+            record['solved_speed'] = bool(solved_speed) or record.get('solved_speed', False)
+            record['solved_knowledge'] = bool(solved_knowledge) or record.get('solved_knowledge', False)
+            self._daily_cache[uid] = record
+        return record
+
+    async def set_daily(self, uid: int, record: Dict[str, Any]) -> None:
+        await self._run(
+            "INSERT OR REPLACE INTO daily (uid, date, data, solved_speed, solved_knowledge) VALUES (?, ?, ?, ?, ?)",
+            (uid, record['date'], orjson.dumps(record), record['solved_speed'], record['solved_knowledge'])
+        )
+        self._daily_cache[uid] = record
+
+    async def mark_solved(self, uid: int, day: str, problem_type: str) -> None:
+        """Set one solved flag on the user's record for day; problem_type is 'speed' or 'knowledge'"""
+        column = f'solved_{problem_type}'
+        if column not in self._SOLVED_COLUMNS:
+            raise ValueError(f"Unknown problem type: {problem_type}")
+        await self._run(f"UPDATE daily SET {column} = 1 WHERE uid = ? AND date = ?", (uid, day))
+        record = self._daily_cache.get(uid)
+        if record is not None and record.get('date') == day:
+            record[column] = True
 
 leetcode_service = LeetCodeService()
 gemini_service = GeminiService()
+user_store = UserStore(_DB_PATH)
 
-async def safe_send_message(update: Update, text: str, parse_mode: str = None) -> None:
-    try:
-        await update.message.reply_text(text, parse_mode=parse_mode)
-    except Exception as e:
-        logger.error(f"Message send error: {e}")
-        clean_text = text.replace('*', '').replace('_', '').replace('`', '')
+def _split_message(text: str) -> List[str]:
+    """Split text into Telegram-sized chunks, breaking on newlines where possible"""
+    chunks = []
+    while len(text) > _MAX_MESSAGE_LENGTH:
+        cut = text.rfind('\n', 0, _MAX_MESSAGE_LENGTH)
+        if cut <= 0:
+            cut = _MAX_MESSAGE_LENGTH
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    chunks.append(text)
+    return chunks
+
+async def safe_send_message(update: Update, text: str, parse_mode: str = None,
+                            reply_markup: InlineKeyboardMarkup = None) -> None:
+    """Reply with text as one message, splitting only if it exceeds Telegram's length limit"""
+    chunks = _split_message(text)
+    for i, chunk in enumerate(chunks):
+        # Attach the keyboard to the last chunk only
+        markup = reply_markup if i == len(chunks) - 1 else None
         try:
-            await update.message.reply_text(clean_text)
-        except Exception as e2:
-            logger.error(f"Fallback message send error: {e2}")
+            await update.message.reply_text(chunk, parse_mode=parse_mode, reply_markup=markup)
+        except Exception as e:
+            logger.error(f"Message send error: {e}")
+            clean_text = chunk.translate(_MD_STRIP_TABLE)
+            try:
+                await update.message.reply_text(clean_text, reply_markup=markup)
+            except Exception as e2:
+                logger.error(f"Fallback message send error: {e2}")
+
+async def broadcast(bot: Bot, text: str, chat_ids: Set[int]) -> int:
+    """Send text to every chat concurrently and return how many were delivered"""
+    semaphore = asyncio.Semaphore(_BROADCAST_CONCURRENCY)
+    # Each slot waits this long after a send, capping the total at _BROADCAST_RATE per second
+    interval = _BROADCAST_CONCURRENCY / _BROADCAST_RATE
+
+    async def send_one(chat_id: int) -> bool:
+        async with semaphore:
+            try:
+                for _ in range(3):
+                    try:
+                        await bot.send_message(chat_id, text)
+                        return True
+                    except RetryAfter as e:
+                        await asyncio.sleep(e.retry_after)
+                    except Forbidden:
+                        # User blocked the bot; stop messaging them
+                        user_chat_ids.discard(chat_id)
+                        await user_store.remove_chat(chat_id)
+                        return False
+                    except TelegramError as e:
+                        logger.error(f"Broadcast to {chat_id} failed: {e}")
+                        return False
+                logger.warning(f"Broadcast to {chat_id} gave up after repeated flood control")
+                return False
+            finally:
+                await asyncio.sleep(interval)
+
+    results = await asyncio.gather(*(send_one(chat_id) for chat_id in list(chat_ids)))
+    return sum(results)
+
+def problem_keyboard(*buttons: tuple) -> InlineKeyboardMarkup:
+    """Build a keyboard with one LeetCode link button per (label, problem) pair"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(label, url=f"https://leetcode.com/problems/{problem.get('titleSlug', '')}/")]
+        for label, problem in buttons
+    ])
+
+async def remember_chat(chat_id: int) -> None:
+    """Track a chat for broadcasts, persisting it the first time it is seen"""
+    if chat_id not in user_chat_ids:
+        user_chat_ids.add(chat_id)
+        await user_store.add_chat(chat_id)
+
+def _today() -> str:
+    """Today's date as YYYY-MM-DD, the key for per-user daily problems"""
+    return date.today().isoformat()
 
 def extract_user_stats(user_data: Dict[str, Any]) -> Dict[str, Any]:
     """Extract user statistics from profile data"""
     stats = user_data.get('submitStats', {})
     ac_stats = stats.get('acSubmissionNum', [])
-    easy_solved = medium_solved = hard_solved = 0
+    counts = {'Easy': 0, 'Medium': 0, 'Hard': 0}
     
     for stat in ac_stats:
-        if stat['difficulty'] == 'Easy':
-            easy_solved = stat['count']
-        elif stat['difficulty'] == 'Medium':
-            medium_solved = stat['count']
-        elif stat['difficulty'] == 'Hard':
-            hard_solved = stat['count']
+        if stat['difficulty'] in counts:
+            counts[stat['difficulty']] = stat['count']
     
+    easy_solved, medium_solved, hard_solved = counts['Easy'], counts['Medium'], counts['Hard']
     total_solved = easy_solved + medium_solved + hard_solved
     ranking = user_data.get('profile', {}).get('ranking', 'N/A')
     
@@ -330,52 +735,99 @@ def extract_user_stats(user_data: Dict[str, Any]) -> Dict[str, Any]:
         'ranking': ranking
     }
 
+# Static replies, built once at import
+_WELCOME_BODY: Final = (
+    "I'm your AI-powered LeetCode companion!\n\n"
+    "✨ What I can do:\n"
+    "• Get personalized daily problems\n"
+    "• Analyze your LeetCode profile\n"
+    "• Create personalized study plans\n"
+    "• Daily challenges with AI hints\n\n"
+    "🎯 Quick Start:\n"
+    "• /recommended2 <username> - Get 2 daily problems\n"
+    "• /profile <username> - Analyze profile\n"
+    "• /daily - Today's challenge\n"
+    "• /help - See all commands"
+)
+
+_HELP_TEXT: Final = (
+    "🤖 LeetCode Bot Commands:\n\n"
+    "📊 Profile & Analysis:\n"
+    "/profile <username> - Get detailed profile analysis\n"
+    "/plan <username> - Get personalized study plan\n\n"
+    "🎯 Daily Recommendations:\n"
+    "✅ /recommended2 <username> - Get personalized daily problems\n"
+    "/solved speed - Mark speed problem as solved\n"
+    "/solved knowledge - Mark knowledge problem as solved\n"
+    "/mystatus - Check your daily progress\n\n"
+    "🎲 Random Problems:\n"
+    "/random - Get any random problem\n"
+    "/easy - Get random easy problem\n"
+    "/medium - Get random medium problem\n"
+    "/hard - Get random hard problem\n\n"
+    "📅 Daily Features:\n"
+    "/daily - Today's daily challenge\n\n"
+    "🛠️ Utilities:\n"
+    "/start - Restart the bot\n"
+    "/help - Show this help\n\n"
+    "💡 Tips:\n"
+    "• Daily problems adapt to your skill level\n"
+    "• Speed problems boost solving pace\n"
+    "• Knowledge problems improve understanding"
+)
+
+_RESPONSES: Final[Dict[str, str]] = {
+    'hello': '👋 Hey there! Ready to solve some LeetCode problems?',
+    'hi': '👋 Hello! Use /recommended2 <username> for daily problems!',
+    'bye': '👋 Goodbye! Keep coding and good luck!',
+    'help': 'Use /help to see all available commands!',
+    'thanks': '😊 You\'re welcome! Happy coding!',
+}
+
+_FALLBACK_MSG: Final = (
+    "🤔 Try:\n"
+    "• /recommended2 <username> - Get daily problems\n"
+    "• /help - See all commands\n"
+    "• Say 'hello' for a greeting!"
+)
+
+_PROBLEM_TEMPLATE: Final = (
+    "{header} #{id}\n\n"
+    "📝 Title: {title}\n"
+    "⚡ Difficulty: {difficulty}\n"
+    "📊 Acceptance Rate: {ac_rate:.1f}%\n"
+    "🏷️ Topics: {topics}\n\n"
+    "💪 Good luck solving this one!"
+)
+
+_DAILY_PROBLEMS_TEMPLATE: Final = (
+    "🎯 Daily Problems for {username}\n\n"
+    "⚡ SPEED PROBLEM (Boost your pace)\n"
+    "#{speed_id} - {speed_title}\n"
+    "Difficulty: {speed_difficulty} | Acceptance: {speed_ac_rate:.1f}%\n\n"
+    "🧠 KNOWLEDGE PROBLEM (Expand your skills)\n"
+    "#{knowledge_id} - {knowledge_title}\n"
+    "Difficulty: {knowledge_difficulty} | Acceptance: {knowledge_ac_rate:.1f}%\n\n"
+    "💡 Use /solved speed or /solved knowledge when done!\n"
+    "📊 Check progress with /mystatus"
+)
+
+_EXISTING_PROBLEMS_TEMPLATE: Final = (
+    "📋 Your Today's Problems ({username})\n\n"
+    "⚡ SPEED PROBLEM - {speed_status}\n"
+    "#{speed_id} - {speed_title}\n\n"
+    "🧠 KNOWLEDGE PROBLEM - {knowledge_status}\n"
+    "#{knowledge_id} - {knowledge_title}\n\n"
+    "{footer}"
+)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_name = update.effective_user.first_name or "there"
-    user_chat_ids.add(update.effective_user.id)
-    welcome_message = (
-        f"🚀 Welcome {user_name}!\n\n"
-        "I'm your AI-powered LeetCode companion!\n\n"
-        "✨ What I can do:\n"
-        "• Get personalized daily problems\n"
-        "• Analyze your LeetCode profile\n"
-        "• Create personalized study plans\n"
-        "• Daily challenges with AI hints\n\n"
-        "🎯 Quick Start:\n"
-        "• /recommended2 <username> - Get 2 daily problems\n"
-        "• /profile <username> - Analyze profile\n"
-        "• /daily - Today's challenge\n"
-        "• /help - See all commands"
-    )
-    await safe_send_message(update, welcome_message)
+    await remember_chat(update.effective_user.id)
+    await safe_send_message(update, f"🚀 Welcome {user_name}!\n\n" + _WELCOME_BODY)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    help_text = (
-        "🤖 LeetCode Bot Commands:\n\n"
-        "📊 Profile & Analysis:\n"
-        "/profile <username> - Get detailed profile analysis\n"
-        "/plan <username> - Get personalized study plan\n\n"
-        "🎯 Daily Recommendations:\n"
-        "✅ /recommended2 <username> - Get personalized daily problems\n"
-        "/solved speed - Mark speed problem as solved\n"
-        "/solved knowledge - Mark knowledge problem as solved\n"
-        "/mystatus - Check your daily progress\n\n"
-        "🎲 Random Problems:\n"
-        "/random - Get any random problem\n"
-        "/easy - Get random easy problem\n"
-        "/medium - Get random medium problem\n"
-        "/hard - Get random hard problem\n\n"
-        "📅 Daily Features:\n"
-        "/daily - Today's daily challenge\n\n"
-        "🛠️ Utilities:\n"
-        "/start - Restart the bot\n"
-        "/help - Show this help\n\n"
-        "💡 Tips:\n"
-        "• Daily problems adapt to your skill level\n"
-        "• Speed problems boost solving pace\n"
-        "• Knowledge problems improve understanding"
-    )
-    await safe_send_message(update, help_text)
+    await safe_send_message(update, _HELP_TEXT)
 
 async def get_recommended_problems(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not context.args:
@@ -384,12 +836,12 @@ async def get_recommended_problems(update: Update, context: ContextTypes.DEFAULT
     
     username = context.args[0]
     user_id = update.effective_user.id
-    user_chat_ids.add(user_id)
-    today = datetime.now().strftime("%Y-%m-%d")
+    await remember_chat(user_id)
+    today = _today()
     
     # Check if user already has today's problems
-    if user_id in user_daily_problems and user_daily_problems[user_id].get('date') == today:
-        daily_data = user_daily_problems[user_id]
+    daily_data = await user_store.get_daily(user_id)
+    if daily_data and daily_data.get('date') == today:
         await send_existing_problems(update, daily_data)
         return
     
@@ -402,7 +854,6 @@ async def get_recommended_problems(update: Update, context: ContextTypes.DEFAULT
         return
     
     user_stats = extract_user_stats(user_data)
-    user_profiles[user_id] = {'username': username, **user_stats}
     
     # Get personalized problems
     problems = await leetcode_service.get_personalized_problems(user_stats)
@@ -411,14 +862,14 @@ async def get_recommended_problems(update: Update, context: ContextTypes.DEFAULT
         return
     
     # Store today's problems
-    user_daily_problems[user_id] = {
+    await user_store.set_daily(user_id, {
         'date': today,
         'username': username,
         'speed_problem': problems['speed_problem'],
         'knowledge_problem': problems['knowledge_problem'],
         'solved_speed': False,
         'solved_knowledge': False
-    }
+    })
     
     await send_daily_problems(update, problems, username)
 
@@ -426,22 +877,19 @@ async def send_daily_problems(update: Update, problems: Dict[str, Dict[str, Any]
     speed_problem = problems['speed_problem']
     knowledge_problem = problems['knowledge_problem']
     
-    message = (
-        f"🎯 Daily Problems for {username}\n\n"
-        f"⚡ SPEED PROBLEM (Boost your pace)\n"
-        f"#{speed_problem.get('frontendQuestionId')} - {speed_problem.get('title')}\n"
-        f"Difficulty: {speed_problem.get('difficulty')} | "
-        f"Acceptance: {speed_problem.get('acRate', 0):.1f}%\n"
-        f"🔗 leetcode.com/problems/{speed_problem.get('titleSlug')}\n\n"
-        f"🧠 KNOWLEDGE PROBLEM (Expand your skills)\n"
-        f"#{knowledge_problem.get('frontendQuestionId')} - {knowledge_problem.get('title')}\n"
-        f"Difficulty: {knowledge_problem.get('difficulty')} | "
-        f"Acceptance: {knowledge_problem.get('acRate', 0):.1f}%\n"
-        f"🔗 leetcode.com/problems/{knowledge_problem.get('titleSlug')}\n\n"
-        f"💡 Use /solved speed or /solved knowledge when done!\n"
-        f"📊 Check progress with /mystatus"
-    )
-    await safe_send_message(update, message)
+    message = _DAILY_PROBLEMS_TEMPLATE.format_map({
+        'username': username,
+        'speed_id': speed_problem.get('frontendQuestionId'),
+        'speed_title': speed_problem.get('title'),
+        'speed_difficulty': speed_problem.get('difficulty'),
+        'speed_ac_rate': speed_problem.get('acRate', 0),
+        'knowledge_id': knowledge_problem.get('frontendQuestionId'),
+        'knowledge_title': knowledge_problem.get('title'),
+        'knowledge_difficulty': knowledge_problem.get('difficulty'),
+        'knowledge_ac_rate': knowledge_problem.get('acRate', 0),
+    })
+    keyboard = problem_keyboard(("⚡ Speed problem", speed_problem), ("🧠 Knowledge problem", knowledge_problem))
+    await safe_send_message(update, message, reply_markup=keyboard)
 
 async def send_existing_problems(update: Update, daily_data: Dict[str, Any]) -> None:
     speed_problem = daily_data['speed_problem']
@@ -452,22 +900,23 @@ async def send_existing_problems(update: Update, daily_data: Dict[str, Any]) ->
     speed_status = "✅ SOLVED" if solved_speed else "⏳ PENDING"
     knowledge_status = "✅ SOLVED" if solved_knowledge else "⏳ PENDING"
     
-    message = (
-        f"📋 Your Today's Problems ({daily_data['username']})\n\n"
-        f"⚡ SPEED PROBLEM - {speed_status}\n"
-        f"#{speed_problem.get('frontendQuestionId')} - {speed_problem.get('title')}\n"
-        f"🔗 leetcode.com/problems/{speed_problem.get('titleSlug')}\n\n"
-        f"🧠 KNOWLEDGE PROBLEM - {knowledge_status}\n"
-        f"#{knowledge_problem.get('frontendQuestionId')} - {knowledge_problem.get('title')}\n"
-        f"🔗 leetcode.com/problems/{knowledge_problem.get('titleSlug')}\n\n"
-    )
-    
     if not solved_speed or not solved_knowledge:
-        message += "💡 Use /solved speed or /solved knowledge when done!"
+        footer = "💡 Use /solved speed or /solved knowledge when done!"
     else:
-        message += "🎉 Great job! All problems solved for today!"
+        footer = "🎉 Great job! All problems solved for today!"
     
-    await safe_send_message(update, message)
+    message = _EXISTING_PROBLEMS_TEMPLATE.format_map({
+        'username': daily_data['username'],
+        'speed_status': speed_status,
+        'speed_id': speed_problem.get('frontendQuestionId'),
+        'speed_title': speed_problem.get('title'),
+        'knowledge_status': knowledge_status,
+        'knowledge_id': knowledge_problem.get('frontendQuestionId'),
+        'knowledge_title': knowledge_problem.get('title'),
+        'footer': footer,
+    })
+    keyboard = problem_keyboard(("⚡ Speed problem", speed_problem), ("🧠 Knowledge problem", knowledge_problem))
+    await safe_send_message(update, message, reply_markup=keyboard)
 
 async def mark_solved(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not context.args or context.args[0].lower() not in ['speed', 'knowledge']:
@@ -477,41 +926,43 @@ async def mark_solved(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     user_id = update.effective_user.id
     problem_type = context.args[0].lower()
     
-    if user_id not in user_daily_problems:
+    daily_data = await user_store.get_daily(user_id)
+    if not daily_data:
         await safe_send_message(update, "❌ No daily problems found. Use /recommended2 <username> first!")
         return
     
-    today = datetime.now().strftime("%Y-%m-%d")
-    if user_daily_problems[user_id].get('date') != today:
+    today = _today()
+    if daily_data.get('date') != today:
         await safe_send_message(update, "❌ No problems for today. Use /recommended2 <username>!")
         return
     
     # Mark as solved
+    await user_store.mark_solved(user_id, today, problem_type)
+    daily_data[f'solved_{problem_type}'] = True
     if problem_type == 'speed':
-        user_daily_problems[user_id]['solved_speed'] = True
-        await safe_send_message(update, "⚡ Speed problem marked as solved! Great job! 🎉")
+        parts = ["⚡ Speed problem marked as solved! Great job! 🎉"]
     else:
-        user_daily_problems[user_id]['solved_knowledge'] = True
-        await safe_send_message(update, "🧠 Knowledge problem marked as solved! Excellent! 🎉")
+        parts = ["🧠 Knowledge problem marked as solved! Excellent! 🎉"]
     
     # Check if both are solved
-    daily_data = user_daily_problems[user_id]
     if daily_data['solved_speed'] and daily_data['solved_knowledge']:
-        await safe_send_message(update, "🏆 Amazing! You've completed both daily problems! Keep up the great work!")
+        parts.append("🏆 Amazing! You've completed both daily problems! Keep up the great work!")
+    await safe_send_message(update, "\n\n".join(parts))
 
 async def check_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
     
-    if user_id not in user_daily_problems:
+    daily_data = await user_store.get_daily(user_id)
+    if not daily_data:
         await safe_send_message(update, "❌ No daily problems found. Use /recommended2 <username> first!")
         return
     
-    today = datetime.now().strftime("%Y-%m-%d")
-    if user_daily_problems[user_id].get('date') != today:
+    today = _today()
+    if daily_data.get('date') != today:
         await safe_send_message(update, "❌ No problems for today. Use /recommended2 <username>!")
         return
     
-    await send_existing_problems(update, user_daily_problems[user_id])
+    await send_existing_problems(update, daily_data)
 
 async def get_random_problem(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text("🎲 Finding a random problem for you...")
@@ -546,28 +997,22 @@ async def get_random_hard(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await safe_send_message(update, "❌ Couldn't fetch a hard problem.")
 
 async def format_and_send_problem(update: Update, problem: Dict[str, Any], header: str) -> None:
-    title = problem.get('title', 'Unknown')
-    difficulty = problem.get('difficulty', 'Unknown')
-    problem_id = problem.get('frontendQuestionId', 'Unknown')
-    topics = [tag['name'] for tag in problem.get('topicTags', [])]
-    acceptance_rate = problem.get('acRate', 0)
-    problem_message = (
-        f"{header} #{problem_id}\n\n"
-        f"📝 Title: {title}\n"
-        f"⚡ Difficulty: {difficulty}\n"
-        f"📊 Acceptance Rate: {acceptance_rate:.1f}%\n"
-        f"🏷️ Topics: {', '.join(topics[:5])}\n\n"
-        f"🔗 leetcode.com/problems/{problem.get('titleSlug', '')}\n\n"
-        f"💪 Good luck solving this one!"
-    )
-    await safe_send_message(update, problem_message)
+    problem_message = _PROBLEM_TEMPLATE.format_map({
+        'header': header,
+        'id': problem.get('frontendQuestionId', 'Unknown'),
+        'title': problem.get('title', 'Unknown'),
+        'difficulty': problem.get('difficulty', 'Unknown'),
+        'ac_rate': problem.get('acRate', 0),
+        'topics': ', '.join(tag['name'] for tag in islice(problem.get('topicTags') or (), 5)),
+    })
+    await safe_send_message(update, problem_message, reply_markup=problem_keyboard(("🔗 Open on LeetCode", problem)))
 
 async def get_user_profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not context.args:
         await safe_send_message(update, "Please provide a LeetCode username.\nUsage: /profile <username>")
         return
     username = context.args[0]
-    user_chat_ids.add(update.effective_user.id)
+    await remember_chat(update.effective_user.id)
     await update.message.reply_text(f"🔍 Analyzing profile for {username}...")
     user_data = await leetcode_service.get_user_profile(username)
     if not user_data:
@@ -591,40 +1036,41 @@ async def get_user_profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     )
     await safe_send_message(update, profile_message)
 
+# Skill level by total solved: below 50 is Beginner, 500+ is Expert
+_LEVEL_THRESHOLDS: Final = (50, 150, 300, 500)
+_LEVEL_LABELS: Final = ("🌱 Beginner", "📚 Learning", "💪 Intermediate", "🎯 Advanced", "🏆 Expert")
+
+# (predicate(total, easy, medium, hard), insight), checked in order
+_INSIGHT_RULES: Final = (
+    (lambda total, easy, medium, hard: easy > medium * 2 and medium > 0,
+     "Focus more on medium problems to level up your skills"),
+    (lambda total, easy, medium, hard: medium > easy and total > 50,
+     "Great balance! Consider adding more hard problems to your practice"),
+    (lambda total, easy, medium, hard: hard > medium and total > 100,
+     "Impressive hard problem solving! You're at an advanced level"),
+    (lambda total, easy, medium, hard: easy + medium + hard != total,
+     "Keep solving problems consistently across all difficulty levels"),
+)
+
 def determine_user_level(total: int, easy: int, medium: int, hard: int) -> str:
-    if total < 50:
-        return "🌱 Beginner"
-    elif total < 150:
-        return "📚 Learning"
-    elif total < 300:
-        return "💪 Intermediate"
-    elif total < 500:
-        return "🎯 Advanced"
-    else:
-        return "🏆 Expert"
+    return _LEVEL_LABELS[bisect_right(_LEVEL_THRESHOLDS, total)]
 
 def get_profile_insight(total: int, easy: int, medium: int, hard: int) -> str:
     if total == 0:
         return "Ready to start your LeetCode journey!"
-    elif total < 10:
+    if total < 10:
         return "Great start! Focus on easy problems to build confidence"
-    elif easy > medium * 2 and medium > 0:
-        return "Focus more on medium problems to level up your skills"
-    elif medium > easy and total > 50:
-        return "Great balance! Consider adding more hard problems to your practice"
-    elif hard > medium and total > 100:
-        return "Impressive hard problem solving! You're at an advanced level"
-    elif easy + medium + hard != total:
-        return "Keep solving problems consistently across all difficulty levels"
-    else:
-        return "Steady progress across all difficulty levels - keep it up!"
+    for predicate, insight in _INSIGHT_RULES:
+        if predicate(total, easy, medium, hard):
+            return insight
+    return "Steady progress across all difficulty levels - keep it up!"
 
 async def generate_study_plan(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not context.args:
         await safe_send_message(update, "Please provide a LeetCode username.\nUsage: /plan <username>")
         return
     username = context.args[0]
-    user_chat_ids.add(update.effective_user.id)
+    await remember_chat(update.effective_user.id)
     await update.message.reply_text(f"🧠 Creating personalized study plan for {username}...")
     user_data = await leetcode_service.get_user_profile(username)
     if not user_data:
@@ -652,84 +1098,238 @@ async def get_daily_challenge(update: Update, context: ContextTypes.DEFAULT_TYPE
     question = daily_data.get('question', {})
     title = question.get('title', 'Unknown')
     difficulty = question.get('difficulty', 'Unknown')
-    topics = [tag['name'] for tag in question.get('topicTags', [])]
+    topics = ', '.join(tag['name'] for tag in islice(question.get('topicTags') or (), 5))
     acceptance_rate = question.get('acRate', 0)
     daily_message = (
         f"📅 Today's Daily Challenge\n\n"
         f"🎯 Problem: {title}\n"
         f"⚡ Difficulty: {difficulty}\n"
         f"📊 Acceptance Rate: {acceptance_rate:.1f}%\n"
-        f"🏷️ Topics: {', '.join(topics[:5])}\n\n"
+        f"🏷️ Topics: {topics}\n\n"
         f"💡 Daily challenges give you extra points!\n"
         f"🔗 Solve at: leetcode.com/problems/{question.get('titleSlug', '')}"
     )
     await safe_send_message(update, daily_message)
 
+async def refresh_problems(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin-only: refetch the problem list and rewrite the on-disk cache"""
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
+    await update.message.reply_text("🔄 Refreshing problem cache...")
+    problems = await leetcode_service.get_all_problems(force_refresh=True)
+    if problems:
+        await safe_send_message(update, f"✅ Cached {len(problems)} problems.")
+    else:
+        await safe_send_message(update, "❌ Refresh failed. Keeping the existing cache.")
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin-only: send a message to every known user"""
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
+    text = update.message.text.partition(' ')[2].strip()
+    if not text:
+        await safe_send_message(update, "Usage: /broadcast <message>")
+        return
+    total = len(user_chat_ids)
+    delivered = await broadcast(context.bot, text, user_chat_ids)
+    await safe_send_message(update, f"📣 Broadcast delivered to {delivered}/{total} users.")
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.message or not update.message.text:
         return
     text = update.message.text.lower().strip()
     user_id = update.effective_user.id
-    user_chat_ids.add(user_id)
-    responses = {
-        'hello': '👋 Hey there! Ready to solve some LeetCode problems?',
-        'hi': '👋 Hello! Use /recommended2 <username> for daily problems!',
-        'bye': '👋 Goodbye! Keep coding and good luck!',
-        'help': 'Use /help to see all available commands!',
-        'thanks': '😊 You\'re welcome! Happy coding!',
-    }
-    response = responses.get(text)
+    await remember_chat(user_id)
+    response = _RESPONSES.get(text)
     if response:
         await safe_send_message(update, response)
         logger.info(f"User {user_id} sent: {text}")
     else:
-        await safe_send_message(update, 
-            "🤔 Try:\n"
-            "• /recommended2 <username> - Get daily problems\n"
-            "• /help - See all commands\n"
-            "• Say 'hello' for a greeting!"
-        )
+        await safe_send_message(update, _FALLBACK_MSG)
+
+async def _warm_problem_cache() -> None:
+    try:
+        await leetcode_service.get_all_problems()
+    except Exception as e:
+        logger.error(f"Problem cache warm-up failed: {e}")
+
+async def _warm_connections() -> None:
+    """Pre-resolve DNS and open TLS to LeetCode and Gemini so the first requests reuse pooled connections"""
+    session = _get_session()
+    for url in ("https://leetcode.com/graphql", "https://generativelanguage.googleapis.com/"):
+        try:
+            async with session.head(url, timeout=_TIMEOUT_SHORT):
+                pass
+        except Exception as e:
+            logger.warning(f"Connection warm-up to {url} failed: {e}")
+
+async def _periodic_refresh() -> None:
+    """Refetch the problem list and purge expired daily records once per cache TTL"""
+    while True:
+        await asyncio.sleep(_CACHE_TTL)
+        try:
+            await leetcode_service.get_all_problems(force_refresh=True)
+        except Exception as e:
+            logger.error(f"Periodic problem refresh failed: {e}")
+        try:
+            await user_store.purge_daily()
+        except Exception as e:
+            logger.error(f"Periodic daily record purge failed: {e}")
+
+def _log_errors(batch: List[Tuple[object, BaseException]]) -> None:
+    logger.error('\n'.join(
+        f'Update {update} caused error {error}\n'
+        + ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+        for update, error in batch
+    ))
+
+async def _drain_errors(error_queue: asyncio.Queue) -> None:
+    """Log queued errors in batches of up to _ERROR_BATCH_SIZE or every _ERROR_BATCH_WAIT seconds"""
+    loop = asyncio.get_running_loop()
+    batch = []
+    try:
+        while True:
+            batch.append(await error_queue.get())
+            deadline = loop.time() + _ERROR_BATCH_WAIT
+            while len(batch) < _ERROR_BATCH_SIZE and (timeout := deadline - loop.time()) > 0:
+                try:
+                    batch.append(await asyncio.wait_for(error_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            _log_errors(batch)
+            batch = []
+    except asyncio.CancelledError:
+        # Flush whatever is left before shutting down
+        while not error_queue.empty():
+            batch.append(error_queue.get_nowait())
+        if batch:
+            _log_errors(batch)
+        raise
+
+async def post_init(application: Application) -> None:
+    """Open the shared HTTP session and user store, and warm caches and connections before the first update"""
+    # Telegram needs no extra warm-up: Application.initialize() already called get_me()
+    _get_session()
+    _background_tasks.add(asyncio.create_task(_warm_connections()))
+    await user_store.open()
+    user_chat_ids.update(await user_store.load_chat_ids())
+    _background_tasks.add(asyncio.create_task(_warm_problem_cache()))
+    _background_tasks.add(asyncio.create_task(_periodic_refresh()))
+
+    global _error_queue
+    _error_queue = asyncio.Queue(maxsize=_ERROR_QUEUE_SIZE)
+    _background_tasks.add(asyncio.create_task(_drain_errors(_error_queue)))
+
+async def post_shutdown(application: Application) -> None:
+    """Stop background tasks and release resources once in-flight handlers have drained"""
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    # One failing close must not leave the database without its final checkpoint
+    for name, close in (("HTTP session", _close_session), ("user store", user_store.close)):
+        try:
+            await close()
+        except Exception as e:
+            logger.error(f"Error closing {name} during shutdown: {e}")
+    logger.info("Shutdown complete")
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    logger.error(f'Update {update} caused error {context.error}')
+    try:
+        _error_queue.put_nowait((update, context.error))
+    except (asyncio.QueueFull, AttributeError):
+        # Queue is full (error storm) or not created yet; log inline rather than lose it
+        logger.error(f'Update {update} caused error {context.error}')
     if update and update.message:
         await safe_send_message(update, '⚠️ Something went wrong. Please try again.')
 
+# Command name -> handler, routed by dispatch_command
+COMMANDS: Final = (
+    ("start", start),
+    ("help", help_command),
+    ("recommended2", get_recommended_problems),
+    ("solved", mark_solved),
+    ("mystatus", check_status),
+    ("profile", get_user_profile),
+    ("daily", get_daily_challenge),
+    ("plan", generate_study_plan),
+    ("random", get_random_problem),
+    ("easy", get_random_easy),
+    ("medium", get_random_medium),
+    ("hard", get_random_hard),
+    ("refresh", refresh_problems),
+    ("broadcast", broadcast_command),
+)
+CMD_TABLE: Final[Dict[str, Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[None]]]] = dict(COMMANDS)
+
+async def dispatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Route /command[@bot] args... to its handler with a single dict lookup"""
+    command, *args = update.message.text.split()
+    name, _, mention = command[1:].partition('@')
+    if mention and mention.lower() != context.bot.username.lower():
+        return  # Addressed to another bot in a group chat
+    handler = CMD_TABLE.get(name.lower())
+    if handler:
+        context.args = args
+        await handler(update, context)
+
 def main() -> None:
+    # Fail fast (non-zero exit) before any network I/O if the configuration is unusable
+    if CONFIG_ERRORS:
+        for error in CONFIG_ERRORS:
+            logger.error(error)
+        sys.exit(1)
+
     logger.info("Starting Enhanced LeetCode Bot...")
     
-    # Validate configuration
-    if TOKEN == 'YOUR_BOT_TOKEN_HERE':
-        logger.error("❌ Please set your bot token! Replace 'YOUR_BOT_TOKEN_HERE' with your actual token.")
-        return
-    if GEMINI_API_KEY == 'YOUR_GEMINI_API_KEY_HERE':
-        logger.error("❌ Please set your Gemini API key! Replace 'YOUR_GEMINI_API_KEY_HERE' with your actual key.")
-        return
-    
-    application = ApplicationBuilder().token(TOKEN).build()
-
-    # Register command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("recommended2", get_recommended_problems))
-    application.add_handler(CommandHandler("solved", mark_solved))
-    application.add_handler(CommandHandler("mystatus", check_status))
-    application.add_handler(CommandHandler("profile", get_user_profile))
-    application.add_handler(CommandHandler("daily", get_daily_challenge))
-    application.add_handler(CommandHandler("plan", generate_study_plan))
-    application.add_handler(CommandHandler("random", get_random_problem))
-    application.add_handler(CommandHandler("easy", get_random_easy))
-    application.add_handler(CommandHandler("medium", get_random_medium))
-    application.add_handler(CommandHandler("hard", get_random_hard))
+    application = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .concurrent_updates(256)
+        # One pooled HTTP/2 client for outgoing Bot API calls, sized for the concurrent handlers
+        .request(OrjsonRequest(connection_pool_size=256, pool_timeout=5.0, http_version="2"))
+        .get_updates_request(OrjsonRequest())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+
+    # Register the command dispatcher; concurrent_updates bounds how many run at once
+    application.add_handler(MessageHandler(filters.COMMAND, dispatch_command))
 
     # Register message handler
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(MessageHandler(TEXT_ONLY, handle_message))
 
     # Register error handler
     application.add_error_handler(error_handler)
 
-    logger.info("Enhanced LeetCode Bot started successfully! 🚀")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if uvloop is not None:
+        # Must happen before PTB creates its event loop
+        uvloop.install()
+    log_listener = _start_log_listener()
+    logger.info(f"Enhanced LeetCode Bot started successfully in {MODE} mode! 🚀")
+    try:
+        if MODE == 'webhook':
+            application.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=ALLOWED_UPDATES
+            )
+        else:
+            # timeout=30 lets Telegram hold each getUpdates open (true long polling)
+            application.run_polling(
+                poll_interval=0.0,
+                timeout=30,
+                bootstrap_retries=-1,
+                drop_pending_updates=True,
+                allowed_updates=ALLOWED_UPDATES
+            )
+    finally:
+        # Flushes any records still queued
+        log_listener.stop()
 
 if __name__ == '__main__':
     main()